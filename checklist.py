@@ -0,0 +1,145 @@
+import hashlib
+import html
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+from pymupdf import Rect
+
+from entry import ChecklistEntry
+from helpers import chunk_size, smart_log, stepped_outpath
+from pdfio import atomic_open, open_pdf
+
+# 切り抜き画像でマーカーの周囲をどれだけ余分に含めるか（pt）
+CROP_MARGIN = 12.0
+
+DEFAULT_DPI = 150
+
+# 描画方法を変えたら上げて、古い切り抜きをキャッシュから使わないようにする
+CROP_VERSION = 2
+
+
+class CropJob(NamedTuple):
+    page_index: int
+    rect: tuple[float, float, float, float]
+    out_path: str
+
+
+def crop_name(
+    source_key: str, page_index: int, rect: tuple, dpi: int, margin: float
+) -> str:
+    # 元PDF・ページ・矩形・解像度が変わらなければ同じファイル名になるので、再実行時は描画を省略できる
+    key = f"{CROP_VERSION}|{source_key}|{page_index}|{','.join(f'{v:.2f}' for v in rect)}|{dpi}|{margin}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".png"
+
+
+def source_key(pdf_path: str) -> str:
+    st = os.stat(pdf_path)
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def render_crops(pdf_path: str, jobs: list[CropJob], dpi: int, margin: float) -> int:
+    """
+    ワーカープロセスで実行する。`Document` はプロセス間で受け渡せないので、ワーカーごとに開き直す。
+    """
+    doc = open_pdf(pdf_path)
+    for job in jobs:
+        page = doc[job.page_index]
+        # CSVの座標は回転前のものなので、`page.rect` や `get_pixmap()` と同じ回転後の座標に変換する
+        clip = (Rect(job.rect) + (-margin, -margin, margin, margin)) * page.rotation_matrix
+        clip.intersect(page.rect)
+        pix = page.get_pixmap(dpi=dpi, clip=clip)
+        # キャッシュはファイルの有無で判定するので、書きかけの画像が残らないようにする
+        with atomic_open(job.out_path, "wb") as f:
+            f.write(pix.tobytes("png"))
+    doc.close()
+    return len(jobs)
+
+
+def chunk_jobs(jobs: list[CropJob], count: int) -> list[list[CropJob]]:
+    # ページ順に並べてから分割し、同じページの切り抜きがなるべく同じワーカーに集まるようにする
+    jobs = sorted(jobs, key=lambda j: j.page_index)
+    size = chunk_size(len(jobs), count)
+    return [jobs[i : i + size] for i in range(0, len(jobs), size)]
+
+
+def write_visual_checklist(
+    pdf_path: str,
+    checklist_entries: list[ChecklistEntry],
+    dpi: int = DEFAULT_DPI,
+    margin: float = CROP_MARGIN,
+    workers: int | None = None,
+) -> None:
+    report_path = stepped_outpath(pdf_path, 1, ".html", "_checklist")
+    crop_dir = report_path.with_suffix("")
+    crop_dir.mkdir(exist_ok=True)
+
+    key = source_key(pdf_path)
+    crop_files: list[str] = []
+    pending: list[CropJob] = []
+    for ent in checklist_entries:
+        rect = (ent.entry.X0, ent.entry.Y0, ent.entry.X1, ent.entry.Y1)
+        name = crop_name(key, ent.entry.PageIndex, rect, dpi, margin)
+        crop_files.append(name)
+        out_path = crop_dir / name
+        if not out_path.exists():
+            pending.append(CropJob(ent.entry.PageIndex, rect, str(out_path)))
+
+    # 参照されなくなった古い切り抜きは削除しておく
+    for p in crop_dir.glob("*.png"):
+        if p.name not in crop_files:
+            p.unlink()
+
+    if 0 < len(pending):
+        worker_count = min(workers or os.cpu_count() or 1, len(pending))
+        smart_log(
+            "info",
+            f"{len(pending)}件の切り抜き画像を描画します（キャッシュ済み {len(crop_files) - len(pending)}件）",
+            target_path=crop_dir,
+        )
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            futures = [
+                executor.submit(render_crops, pdf_path, chunk, dpi, margin)
+                for chunk in chunk_jobs(pending, worker_count)
+            ]
+            for future in futures:
+                future.result()
+
+    sections: list[str] = []
+    for ent, name in zip(checklist_entries, crop_files):
+        excluded = "".join(
+            f"<li>coverage {str(ex.coverage)[:5]}: {html.escape(ex.text)}</li>"
+            for ex in ent.excluded
+        )
+        sections.append(
+            f"""<section>
+<h2>{html.escape(ent.entry.Id)}</h2>
+<p>ページインデックス：{ent.entry.PageIndex} ／ ノンブル：{html.escape(ent.entry.Nombre)}</p>
+<img src="{crop_dir.name}/{name}" alt="{html.escape(ent.entry.Id)}">
+<p>抽出テキスト：{html.escape(ent.entry.Text)}</p>
+<p>除外テキスト：</p>
+<ul>{excluded}</ul>
+</section>"""
+        )
+
+    with atomic_open(report_path, "w", encoding="utf-8") as f:
+        f.write(
+            f"""<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(Path(pdf_path).name)}</title>
+<style>
+section {{ border-bottom: 1px solid #ccc; padding: 1em 0; }}
+img {{ border: 1px solid #999; max-width: 100%; }}
+</style>
+</head>
+<body>
+{"\n".join(sections)}
+</body>
+</html>
+"""
+        )
+    smart_log("info", "目視確認用のチェックリストを出力しました", target_path=report_path)
@@ -1,6 +1,7 @@
 import csv
-from pathlib import Path
+import json
 from dataclasses import dataclass
+from typing import NamedTuple, TextIO
 
 
 @dataclass
@@ -32,6 +33,41 @@ class HighlightEntry:
     X1: float
     Y1: float
 
+    @classmethod
+    def from_row(cls, row: list[str]) -> HighlightEntry:
+        return cls(
+            Id=row[0],
+            PageIndex=int(row[1]),
+            Nombre=row[2],
+            Name=row[3].strip(),  # 手入力で入るかもしれないスペースを除去
+            Text=row[4],
+            X0=float(row[5]),
+            Y0=float(row[6]),
+            X1=float(row[7]),
+            Y1=float(row[8]),
+        )
+
+
+class ExcludedWord(NamedTuple):
+    """
+    マーカーの矩形に一部だけ重なったため抽出対象から除外した単語。
+
+    - text: 単語の文字列
+    - coverage: 矩形の高さに占める、単語と矩形の重なり部分の高さの比率
+    """
+
+    text: str
+    coverage: float
+
+
+class ChecklistEntry(NamedTuple):
+    """
+    目視確認が必要なエントリ（抽出結果と除外した単語の組）。
+    """
+
+    entry: HighlightEntry
+    excluded: list[ExcludedWord]
+
 
 @dataclass
 class Location:
@@ -118,8 +154,27 @@ class KiriCSV:
     def register(self, entry: JsonEntry) -> None:
         self.entries.append(self.to_entry(entry.Nombre, entry.Text))
 
-    def write_csv(self, path: Path) -> None:
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(self.header)
-            writer.writerows(self.entries)
+    def write_csv(self, f: TextIO) -> None:
+        writer = csv.writer(f)
+        writer.writerow(self.header)
+        writer.writerows(self.entries)
+
+
+def load_json_entries(json_path: str) -> list[JsonEntry]:
+    entries: list[JsonEntry] = []
+    with open(json_path, "r", encoding="utf-8") as f:
+        content = json.load(f)
+        for item in content:
+            ent = JsonEntry(
+                Id=item["Id"],
+                PageIndex=item["PageIndex"],
+                Nombre=item["Nombre"],
+                Text=item["Text"],
+                Href=str(
+                    item["Href"]
+                ).strip(),  # 手入力で入るかもしれないスペースを除去
+                AutoFlag=item["AutoFlag"],
+                Locations=[Location.from_dict(l) for l in item["Locations"]],
+            )
+            entries.append(ent)
+    return entries
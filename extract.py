@@ -7,19 +7,16 @@ import sys
 
 from pathlib import Path
 from dataclasses import astuple, fields
-from typing import NamedTuple
 
 
-import pymupdf
-from pymupdf import Annot, Page, Rect, Quad
+from pymupdf import Annot, Document, Page, Rect, Quad
 
-from entry import HighlightEntry
-from helpers import smart_log, stepped_outpath
-
-
-class ExcludedWord(NamedTuple):
-    text: str
-    coverage: float
+from checklist import DEFAULT_DPI, write_visual_checklist
+from entry import ChecklistEntry, ExcludedWord, HighlightEntry
+from helpers import smart_log, split_options, stepped_outpath
+from manifest import Manifest, fingerprint_bytes
+from pdfio import atomic_open, open_pdf, open_pdf_bytes, read_file
+from progress import STATUS_PATH, Progress
 
 
 def text_by_rect(page: Page, rect: Rect) -> tuple[str, list[ExcludedWord]]:
@@ -145,24 +142,58 @@ def sort_multicolumned_rects(page: Page, rects: list[Rect]) -> list[Rect]:
     return sorted(rects, key=_sortkey)
 
 
-class ChecklistEntry(NamedTuple):
-    entry: HighlightEntry
-    excluded: list[ExcludedWord]
+def checklist_from_csv(pdf: Document, csv_path: Path) -> list[ChecklistEntry]:
+    """
+    出力済みのCSV（人間が編集していてもよい）の矩形をもとに、目視確認が必要なエントリを集め直す。
+    """
+    checklist_entries: list[ChecklistEntry] = []
+    with open(csv_path, encoding="utf-8") as f:
+        reader = csv.reader(f)
+        for i, r in enumerate(reader):
+            if i == 0:
+                continue
+            h = HighlightEntry.from_row(r)
+            rect = Rect(h.X0, h.Y0, h.X1, h.Y1)
+            _, excluded = text_by_rect(pdf[h.PageIndex], rect)
+            if 0 < len(excluded):
+                checklist_entries.append(ChecklistEntry(h, excluded))
+    return checklist_entries
 
 
-def extract_annots(pdf_path: str, single_columned: bool) -> None:
+def extract_annots(
+    pdf_path: str,
+    single_columned: bool,
+    visual_dpi: int | None = None,
+    progress: Progress | None = None,
+) -> None:
     smart_log("debug", "処理開始", target_path=pdf_path)
 
     out_csv_path = stepped_outpath(pdf_path, 1, ".csv")
-    if out_csv_path.exists():
-        smart_log(
-            "warning",
-            "出力先のCSVファイルが既に存在しています",
-            target_path=out_csv_path,
-        )
+    manifest = Manifest.for_dir(out_csv_path.parent)
+    build_args = (
+        out_csv_path.name,
+        "extract",
+        [Path(pdf_path)],
+        {"single_columned": single_columned},
+        [out_csv_path],
+    )
+    # CSVは人間が編集するので、編集済みのものは上書きしない
+    if not manifest.should_build(*build_args):
+        if visual_dpi is not None and out_csv_path.exists():
+            # CSVを作り直さない場合も、目視確認用のチェックリストは既存のCSVから出力する
+            pdf = open_pdf(pdf_path)
+            checklist_entries = checklist_from_csv(pdf, out_csv_path)
+            if 0 < len(checklist_entries):
+                write_visual_checklist(pdf_path, checklist_entries, dpi=visual_dpi)
+            pdf.close()
         return
 
-    pdf = pymupdf.Document(pdf_path)
+    data, st = read_file(pdf_path)
+    # 記録用のハッシュは、処理に使うのと同じ読み込み結果から計算する
+    known = {Path(pdf_path).name: fingerprint_bytes(data, st)}
+    pdf = open_pdf_bytes(data)
+    if progress:
+        progress.begin(Path(pdf_path).name, pdf.page_count)
 
     checklist_entries: list[ChecklistEntry] = []
     csv_entries: list[HighlightEntry] = []
@@ -178,8 +209,9 @@ def extract_annots(pdf_path: str, single_columned: bool) -> None:
             highlight_rects = sort_multicolumned_rects(page, highlight_rects)
 
         name = random_name()
+        merged_rects = merge_rects(highlight_rects)
 
-        for r in merge_rects(highlight_rects):
+        for r in merged_rects:
             entry_idx += 1
             target, excluded = text_by_rect(page, r)
 
@@ -202,14 +234,18 @@ def extract_annots(pdf_path: str, single_columned: bool) -> None:
             if is_semantic_end(target):
                 name = random_name()
 
+        if progress:
+            progress.update(i + 1, len(merged_rects))
+
     pdf.close()
 
     header = tuple(f.name for f in fields(HighlightEntry))
-    with open(out_csv_path, "w", newline="", encoding="utf-8") as f:
+    with atomic_open(out_csv_path, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(header)
         for x in csv_entries:
             writer.writerow(astuple(x))
+    manifest.record(*build_args, known=known)
 
     if 0 < len(checklist_entries):
         checklist_path = stepped_outpath(pdf_path, 1, ".txt", "_checklist")
@@ -228,28 +264,52 @@ def extract_annots(pdf_path: str, single_columned: bool) -> None:
             for ex in ent.excluded:
                 lines.append(f"- coverage {str(ex.coverage)[:5]}: {ex.text}")
             lines.append("")
-        checklist_path.write_text("\n".join(lines), encoding="utf-8")
+        with atomic_open(checklist_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+
+        if visual_dpi is not None:
+            write_visual_checklist(pdf_path, checklist_entries, dpi=visual_dpi)
 
 
 def main(args: list[str]) -> None:
+    args, options = split_options(args)
     if len(args) < 2:
         print(
             f"使用方法: `uv run .\\{os.path.basename(__file__)} target\\directory\\path` もしくは、対象PDFが一段組の場合は `uv run .\\extract.py target\\directory\\path 1`"
         )
+        print(
+            "切り抜き画像つきのチェックリスト（HTML）も出力する場合は `--visual` （解像度を指定する場合は `--visual=200`）を付ける"
+        )
         return
     d = Path(args[1])
     if not d.exists():
         smart_log("error", "存在しないパスです", target_path=d)
         return
     is_single_column = 2 < len(args) and args[2] == "1"
+    visual_dpi = None
+    if "visual" in options:
+        visual_dpi = DEFAULT_DPI
+        if options["visual"]:
+            if not options["visual"].isdecimal() or int(options["visual"]) < 1:
+                smart_log(
+                    "error",
+                    "`--visual` の解像度は正の整数で指定してください",
+                    target_str=options["visual"],
+                )
+                return
+            visual_dpi = int(options["visual"])
+    status_path = Path(options["status"]) if options.get("status") else STATUS_PATH
     if d.is_file():
         if d.suffix == ".pdf":
-            extract_annots(str(d), is_single_column)
+            extract_annots(str(d), is_single_column, visual_dpi)
         else:
             smart_log("error", "PDFファイルを指定してください")
     else:
-        for p in d.glob("*.pdf"):
-            extract_annots(str(p), is_single_column)
+        paths = list(d.glob("*.pdf"))
+        with Progress(len(paths), status_path) as progress:
+            for p in paths:
+                extract_annots(str(p), is_single_column, visual_dpi, progress)
+                progress.end()
 
 
 if __name__ == "__main__":
@@ -4,6 +4,8 @@ from pathlib import Path
 from typing import Any, Literal
 from loguru import logger
 
+from entry import JsonEntry
+
 # initialize
 logger.remove()
 
@@ -45,6 +47,29 @@ def smart_log(
     logger.log(level, msg)
 
 
+# 問題箇所をログに列挙する上限（件数はすべて集計する）
+REPORT_LIMIT = 20
+
+
+def limit_items(items: list[str], limit: int = REPORT_LIMIT) -> list[str]:
+    if len(items) <= limit:
+        return items
+    return items[:limit] + [f"ほか{len(items) - limit}件"]
+
+
+def log_missing_href(json_path: Any, entries: list[JsonEntry]) -> None:
+    # エントリごとに警告を出すとログが埋もれるので、ファイルごとにまとめて1回だけ出す
+    if len(entries) < 1:
+        return
+    targets = limit_items([f"{ent.Id}（ノンブル {ent.Nombre}）" for ent in entries])
+    smart_log(
+        "warning",
+        f"リンク先が指定されていないエントリが{len(entries)}件あります: {', '.join(targets)}",
+        target_path=json_path,
+        skip=True,
+    )
+
+
 def stepped_outpath(path: str, step: int, ext: str, suffix: str = "") -> Path:
     p = Path(path)
     stem = p.stem
@@ -56,3 +81,26 @@ def stepped_outpath(path: str, step: int, ext: str, suffix: str = "") -> Path:
         else stem + f"_step{step}"
     ) + suffix
     return p.with_name(new_stem + ext)
+
+
+def chunk_size(total: int, parts: int) -> int:
+    """
+    `total` 件を `parts` 個以内のまとまりに分けるときの、1つあたりの件数（切り上げ、最低1）。
+    """
+    return max(1, -(-total // parts))
+
+
+def split_options(args: list[str]) -> tuple[list[str], dict[str, str]]:
+    """
+    コマンドライン引数を位置引数と `--key=value` 形式のオプションに分ける。
+    値を持たない `--key` は空文字列として扱う。
+    """
+    positionals: list[str] = []
+    options: dict[str, str] = {}
+    for arg in args:
+        if arg.startswith("--"):
+            key, _, value = arg[2:].partition("=")
+            options[key] = value
+        else:
+            positionals.append(arg)
+    return positionals, options
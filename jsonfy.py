@@ -9,6 +9,8 @@ from pathlib import Path
 
 from entry import HighlightEntry, JsonEntry, Location, KiriCSV
 from helpers import smart_log, stepped_outpath
+from manifest import Manifest
+from pdfio import atomic_open
 
 
 def remove_spaces(s: str) -> str:
@@ -36,12 +38,16 @@ def csv_to_json(csv_path: str) -> None:
     out_csv_path = stepped_outpath(csv_path, 2, ".csv", "_kiri")
     out_json_path = stepped_outpath(csv_path, 3, ".json")
 
-    if out_json_path.exists():
-        smart_log(
-            "warning",
-            "出力先のjsonファイルが既に存在しています",
-            target_path=out_json_path,
-        )
+    manifest = Manifest.for_dir(out_json_path.parent)
+    build_args = (
+        out_json_path.name,
+        "jsonfy",
+        [Path(csv_path)],
+        {},
+        [out_json_path, out_csv_path],
+    )
+    # jsonは人間が `Href` を書き込むので、編集済みのものは上書きしない
+    if not manifest.should_build(*build_args):
         return
 
     hs: list[HighlightEntry] = []
@@ -51,17 +57,7 @@ def csv_to_json(csv_path: str) -> None:
         for i, r in enumerate(reader):
             if i == 0:
                 continue
-            h = HighlightEntry(
-                Id=r[0],
-                PageIndex=int(r[1]),
-                Nombre=r[2],
-                Name=r[3].strip(),  # 手入力で入るかもしれないスペースを除去
-                Text=r[4],
-                X0=float(r[5]),
-                Y0=float(r[6]),
-                X1=float(r[7]),
-                Y1=float(r[8]),
-            )
+            h = HighlightEntry.from_row(r)
 
             if h.Name == "":
                 smart_log("info", "Name列が空です", target_str=h.Text, skip=True)
@@ -104,10 +100,14 @@ def csv_to_json(csv_path: str) -> None:
         json_content.append(asdict(ent))
         kiri_csv.register(ent)
 
-    with open(out_json_path, "w", encoding="utf-8") as f:
+    # 次回の実行ではjsonの有無を見るので、jsonは最後に書き出す
+    with atomic_open(out_csv_path, "w", newline="", encoding="utf-8") as f:
+        kiri_csv.write_csv(f)
+
+    with atomic_open(out_json_path, "w", encoding="utf-8") as f:
         json.dump(json_content, f, indent=2, ensure_ascii=False)
 
-    kiri_csv.write_csv(out_csv_path)
+    manifest.record(*build_args)
 
 
 def main(args: list[str]) -> None:
@@ -1,4 +1,3 @@
-import json
 import os
 import sys
 
@@ -7,8 +6,11 @@ from pathlib import Path
 import pymupdf
 from pymupdf import Rect
 
-from entry import JsonEntry, Location
-from helpers import smart_log, stepped_outpath
+from entry import JsonEntry, load_json_entries
+from helpers import log_missing_href, smart_log, split_options, stepped_outpath
+from manifest import Manifest, fingerprint_bytes
+from pdfio import open_pdf_bytes, read_file, save_pdf
+from progress import STATUS_PATH, Progress
 
 
 def from_jsonpath(json_path: str) -> str:
@@ -24,7 +26,7 @@ def from_jsonpath(json_path: str) -> str:
     return ""
 
 
-def insert_links(json_path: str) -> None:
+def insert_links(json_path: str, progress: Progress | None = None) -> None:
     if not json_path.endswith("_step3.json"):
         smart_log(
             "error",
@@ -36,13 +38,6 @@ def insert_links(json_path: str) -> None:
     smart_log("debug", "処理開始", target_path=json_path)
 
     out_pdf_path = stepped_outpath(json_path, 3, ".pdf", "_linked")
-    if out_pdf_path.exists():
-        smart_log(
-            "warning",
-            "出力先のPDFファイルが既に存在しています",
-            target_path=out_pdf_path,
-        )
-        return
 
     pdf_path = from_jsonpath(json_path)
     if pdf_path == "":
@@ -53,25 +48,28 @@ def insert_links(json_path: str) -> None:
         )
         return
 
-    entries: list[JsonEntry] = []
-    with open(json_path, "r", encoding="utf-8") as f:
-        content = json.load(f)
-        for item in content:
-            ent = JsonEntry(
-                Id=item["Id"],
-                PageIndex=item["PageIndex"],
-                Nombre=item["Nombre"],
-                Text=item["Text"],
-                Href=str(
-                    item["Href"]
-                ).strip(),  # 手入力で入るかもしれないスペースを除去
-                AutoFlag=item["AutoFlag"],
-                Locations=[Location.from_dict(l) for l in item["Locations"]],
-            )
-            entries.append(ent)
+    manifest = Manifest.for_dir(out_pdf_path.parent)
+    build_args = (
+        out_pdf_path.name,
+        "linkify",
+        [Path(json_path), Path(pdf_path)],
+        {},
+        [out_pdf_path],
+    )
+    # リンク挿入済みのPDFは人間が編集しないので、入力が変わっていれば作り直してよい
+    if not manifest.should_build(*build_args, protected=False):
+        return
+
+    entries = load_json_entries(json_path)
 
-    doc = pymupdf.Document(pdf_path)
+    data, st = read_file(pdf_path)
+    # 記録用のハッシュは、処理に使うのと同じ読み込み結果から計算する
+    known = {Path(pdf_path).name: fingerprint_bytes(data, st)}
+    doc = open_pdf_bytes(data)
+    if progress:
+        progress.begin(Path(pdf_path).name, doc.page_count)
 
+    skipped: list[JsonEntry] = []
     for ent in entries:
         if ent.Text == "":
             smart_log(
@@ -81,6 +79,10 @@ def insert_links(json_path: str) -> None:
                 skip=True,
             )
             continue
+        if ent.Href == "":
+            # リンク先のない `LINK_URI` を埋め込まないよう、rirify.py と同じくスキップする
+            skipped.append(ent)
+            continue
 
         for loc in ent.Locations:
             page = doc[loc.PageIndex]
@@ -92,12 +94,19 @@ def insert_links(json_path: str) -> None:
                     "uri": ent.Href,
                 }
             )
+            if progress:
+                # エントリはページ順に並んでいるので、直前のページまでは処理済みとみなす
+                progress.update(loc.PageIndex, 1)
+
+    log_missing_href(json_path, skipped)
 
-    doc.save(str(out_pdf_path), garbage=3, clean=True, pretty=True)
+    save_pdf(doc, out_pdf_path, garbage=3, clean=True, pretty=True)
     doc.close()
+    manifest.record(*build_args, known=known)
 
 
 def main(args: list[str]) -> None:
+    args, options = split_options(args)
     if len(args) < 2:
         print(
             f"使用方法: `uv run .\\{os.path.basename(__file__)} target\\directory\\path`"
@@ -107,14 +116,18 @@ def main(args: list[str]) -> None:
     if not d.exists():
         smart_log("error", "存在しないパスです", target_path=d)
         return
+    status_path = Path(options["status"]) if options.get("status") else STATUS_PATH
     if d.is_file():
         if d.suffix == ".json":
             insert_links(str(d))
         else:
             smart_log("error", "jsonファイルを指定してください")
     else:
-        for p in d.glob("*.json"):
-            insert_links(str(p))
+        paths = list(d.glob("*.json"))
+        with Progress(len(paths), status_path) as progress:
+            for p in paths:
+                insert_links(str(p), progress)
+                progress.end()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import os
+import tomllib
+
+from pathlib import Path
+from typing import Any, Literal
+
+from helpers import smart_log
+from pdfio import atomic_open
+
+# 各ツールの `*.json` などのglobに引っかからないよう、拡張子は付けない
+MANIFEST_NAME = ".pdf-linker-manifest"
+
+
+def read_tool_version() -> str:
+    # 出力内容に影響する変更を加えたら pyproject.toml の version を上げる
+    with open(Path(__file__).with_name("pyproject.toml"), "rb") as f:
+        return tomllib.load(f)["project"]["version"]
+
+
+TOOL_VERSION = read_tool_version()
+
+BuildState = Literal["missing", "fresh", "stale", "outdated", "edited", "untracked"]
+
+
+def file_hash(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint_bytes(data: bytes, st: os.stat_result) -> dict:
+    """
+    読み込み済みのファイル内容から記録用の情報を作る。同じファイルをハッシュのために読み直さずに済む。
+    """
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+
+
+def fingerprint(path: Path, previous: dict | None = None) -> dict:
+    """
+    サイズと更新日時が前回と同じならハッシュを計算し直さずに前回の値を使う。
+    """
+    st = path.stat()
+    if (
+        previous
+        and previous.get("size") == st.st_size
+        and previous.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return previous
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_hash(path)}
+
+
+class Manifest:
+    """
+    フォルダごとに、各出力ファイルがどの入力・オプション・ツールのバージョンから生成されたかを記録する。
+
+    `status()` が返す状態：
+
+    - missing: 主となる出力ファイル（`outputs` の先頭）がない
+    - fresh: 記録時から入力・オプション・バージョンが変わっていない
+    - stale: 入力が変わっていて、出力は記録時のまま
+    - outdated: 入力は変わっていないが、オプションかバージョンが変わっていて、出力は記録時のまま
+    - edited: 入力などが変わっていて、出力も記録後に書き換えられている（手作業で編集された）
+    - untracked: 出力ファイルはあるが記録がない（記録を始める前に生成されたもの）
+    """
+
+    _loaded: dict[Path, "Manifest"] = {}
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.records: dict[str, dict] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                self.records = json.load(f).get("artifacts", {})
+
+    @classmethod
+    def for_dir(cls, directory: Path) -> "Manifest":
+        key = directory.resolve()
+        if key not in cls._loaded:
+            cls._loaded[key] = cls(key / MANIFEST_NAME)
+        return cls._loaded[key]
+
+    def save(self) -> None:
+        with atomic_open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"artifacts": self.records}, f, indent=2, ensure_ascii=False)
+
+    def recorded_outputs(self, key: str) -> list[Path]:
+        rec = self.records.get(key, {})
+        return [self.path.parent / name for name in rec.get("outputs", {})]
+
+    def check(
+        self,
+        key: str,
+        tool: str,
+        inputs: list[Path],
+        options: dict[str, Any],
+        outputs: list[Path],
+    ) -> tuple[BuildState, bool]:
+        """
+        `status()` と同じ状態に加えて、入力ファイルが変わったかどうかを返す。
+        """
+        # 主となる出力は最後に書き出すので、これがあれば他の出力も一度は書き出されている
+        if not outputs[0].exists():
+            return "missing", True
+        rec = self.records.get(key)
+        if rec is None:
+            return "untracked", True
+
+        recorded_inputs: dict = rec.get("inputs", {})
+        inputs_changed = sorted(recorded_inputs) != sorted(p.name for p in inputs)
+        if not inputs_changed:
+            current = {p.name: fingerprint(p, recorded_inputs[p.name]) for p in inputs}
+            inputs_changed = any(
+                current[name]["sha256"] != recorded_inputs[name]["sha256"]
+                for name in current
+            )
+            if not inputs_changed and current != recorded_inputs:
+                # 更新日時だけが変わっていた場合は記録し直して、次回からハッシュの計算を省く
+                rec["inputs"] = current
+                self.save()
+        settings_changed = (
+            rec.get("tool") != tool
+            or rec.get("version") != TOOL_VERSION
+            or rec.get("options") != options
+        )
+        # 主でない出力が消えている場合は、入力が変わった場合と同じく作り直す
+        inputs_changed = inputs_changed or not all(p.exists() for p in outputs)
+        if not inputs_changed and not settings_changed:
+            return "fresh", False
+
+        recorded_outputs: dict = rec.get("outputs", {})
+        for p in outputs:
+            if not p.exists():
+                continue
+            prev = recorded_outputs.get(p.name)
+            if prev is None or fingerprint(p, prev)["sha256"] != prev["sha256"]:
+                return "edited", inputs_changed
+        return ("stale" if inputs_changed else "outdated"), inputs_changed
+
+    def status(
+        self,
+        key: str,
+        tool: str,
+        inputs: list[Path],
+        options: dict[str, Any],
+        outputs: list[Path],
+    ) -> BuildState:
+        return self.check(key, tool, inputs, options, outputs)[0]
+
+    def should_build(
+        self,
+        key: str,
+        tool: str,
+        inputs: list[Path],
+        options: dict[str, Any],
+        outputs: list[Path],
+        protected: bool = True,
+    ) -> bool:
+        """
+        出力を生成し直すべきかを判定する。PDFを開く前に呼ぶこと。
+        `protected` な出力（人間が編集するファイル）は、記録のないものや記録後に編集されたものを上書きしない。
+        """
+        state, inputs_changed = self.check(key, tool, inputs, options, outputs)
+        if state == "fresh":
+            smart_log("debug", "出力は最新です", target_path=outputs[0], skip=True)
+            return False
+        if protected and state == "untracked":
+            smart_log(
+                "warning",
+                "出力先のファイルが既に存在しています",
+                target_path=outputs[0],
+                skip=True,
+            )
+            return False
+        if protected and state == "edited":
+            rec = self.records[key]
+            if inputs_changed:
+                smart_log(
+                    "warning",
+                    "入力ファイルが更新されていますが、出力先のファイルが編集されているため上書きしません",
+                    target_path=outputs[0],
+                    skip=True,
+                )
+            elif rec.get("tool") != tool or rec.get("options") != options:
+                smart_log(
+                    "warning",
+                    "オプションが前回と異なりますが、出力先のファイルが編集されているため上書きしません",
+                    target_path=outputs[0],
+                    skip=True,
+                )
+            else:
+                # バージョンが変わっただけなら編集済みの出力をそのまま使い続けるので、
+                # 記録のバージョンだけを更新して、次回からは警告しない
+                rec["version"] = TOOL_VERSION
+                self.save()
+                smart_log(
+                    "info",
+                    "ツールのバージョンが更新されましたが、出力先のファイルが編集されているため上書きしません",
+                    target_path=outputs[0],
+                    skip=True,
+                )
+            return False
+        if state == "stale":
+            smart_log("info", "出力が最新ではないため出力し直します", target_path=outputs[0])
+        if state == "outdated":
+            smart_log(
+                "info",
+                "オプションかツールのバージョンが前回と異なるため出力し直します",
+                target_path=outputs[0],
+            )
+        return True
+
+    def record(
+        self,
+        key: str,
+        tool: str,
+        inputs: list[Path],
+        options: dict[str, Any],
+        outputs: list[Path],
+        known: dict[str, dict] | None = None,
+    ) -> None:
+        """
+        `known` には、処理中に読み込んだ入力ファイルの `fingerprint_bytes()` をファイル名ごとに渡す。
+        """
+        known = known or {}
+        prev = self.records.get(key, {})
+        prev_inputs = prev.get("inputs", {})
+        self.records[key] = {
+            "tool": tool,
+            "version": TOOL_VERSION,
+            "options": options,
+            "inputs": {
+                p.name: known.get(p.name) or fingerprint(p, prev_inputs.get(p.name))
+                for p in inputs
+            },
+            "outputs": {p.name: fingerprint(p) for p in outputs},
+        }
+        self.save()
@@ -0,0 +1,74 @@
+import os
+import stat
+import tempfile
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+import pymupdf
+
+
+def read_file(path: str | Path) -> tuple[bytes, os.stat_result]:
+    """
+    ファイルを1回の一括読み込みでメモリに載せる。あわせて、読み込んだ時点の `stat` を返す。
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        data = f.read()
+    return data, st
+
+
+def open_pdf_bytes(data: bytes) -> pymupdf.Document:
+    return pymupdf.Document(stream=data, filetype="pdf")
+
+
+def open_pdf(path: str | Path) -> pymupdf.Document:
+    """
+    PDFを1回の一括読み込みでメモリに載せてから開く。
+    パスを渡して開くとMuPDFが細かい読み込みを繰り返すため、ネットワークドライブ上では遅くなる。
+    """
+    data, _ = read_file(path)
+    return open_pdf_bytes(data)
+
+
+def target_mode(path: Path) -> int:
+    """
+    置き換え先が既にあればそのパーミッションを、なければ umask を適用した既定値（通常は 0644）を返す。
+    """
+    try:
+        return stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+@contextmanager
+def atomic_open(path: str | Path, mode: str = "w", **kwargs: Any) -> Iterator[IO]:
+    """
+    同じフォルダの一時ファイルに書き込み、fsyncしてから `path` へ置き換える。
+    途中で失敗した場合は一時ファイルを削除するので、書きかけのファイルが完成品として残ることはない。
+    """
+    p = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=p.parent, prefix=f".{p.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode, **kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # `mkstemp()` は 0600 で作成するので、通常の `open()` で書いた場合と同じ権限に揃える
+        os.chmod(tmp_path, target_mode(p))
+        os.replace(tmp_path, p)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def save_pdf(doc: pymupdf.Document, path: str | Path, **options: Any) -> None:
+    """
+    `Document.save()` の代わりに、メモリ上で書き出したバイト列を1回で書き込む。
+    """
+    data = doc.tobytes(**options)
+    with atomic_open(path, "wb") as f:
+        f.write(data)
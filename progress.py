@@ -0,0 +1,186 @@
+import json
+import time
+
+from datetime import datetime
+from pathlib import Path
+from typing import Literal
+
+from helpers import smart_log
+from pdfio import atomic_open
+
+# 中身はJSONだが、各ツールの `*.json` のglobに引っかからないよう拡張子は付けない
+STATUS_PATH = Path(".pdf-linker-status")
+
+# コンソールとステータスファイルを更新する間隔（秒）
+REPORT_INTERVAL = 5.0
+
+State = Literal["running", "finished", "failed"]
+
+STATE_LABELS: dict[str, str] = {
+    "running": "進捗",
+    "finished": "完了",
+    "failed": "異常終了",
+}
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "不明"
+    s = int(seconds)
+    return f"{s // 3600}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+
+class Progress:
+    """
+    ディレクトリ単位のバッチ処理の進捗を記録する。
+
+    - ページごとのループからは `update()` だけを呼ぶ。時刻の確認以外は整数の加算のみで、
+      実際の出力は `REPORT_INTERVAL` 秒に1回だけ行う
+    - 出力先はコンソール（ログ）と、監視ツールから読み取るためのステータスファイル（JSON形式）
+    - `with` 文で使う。途中で例外が起きた場合はステータスを `failed` にして、停止と区別できるようにする
+    """
+
+    def __init__(
+        self,
+        total_docs: int,
+        status_path: Path | None = STATUS_PATH,
+        interval: float = REPORT_INTERVAL,
+    ) -> None:
+        self.total_docs = total_docs
+        self.status_path = status_path
+        self.interval = interval
+
+        self.started = time.monotonic()
+        self.next_report = self.started + interval
+        self.docs_done = 0
+        self.pages_done = 0
+        self.highlights_done = 0
+
+        self.doc_name = ""
+        self.doc_page_count = 0
+        self.doc_pages = 0
+        self.doc_highlights = 0
+        self.doc_started = self.started
+
+    def __enter__(self) -> "Progress":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.report("finished" if exc_type is None else "failed")
+
+    def begin(self, name: str, page_count: int) -> None:
+        self.doc_name = name
+        self.doc_page_count = page_count
+        self.doc_pages = 0
+        self.doc_highlights = 0
+        self.doc_started = time.monotonic()
+
+    def update(self, pages: int, highlights: int = 0) -> None:
+        """
+        現在のファイルで `pages` ページ目まで処理し、新たに `highlights` 件のマーカーを処理したことを記録する。
+        """
+        if self.doc_pages < pages:
+            self.pages_done += pages - self.doc_pages
+            self.doc_pages = pages
+        self.highlights_done += highlights
+        self.doc_highlights += highlights
+        if time.monotonic() < self.next_report:
+            return
+        self.report()
+
+    def end(self) -> None:
+        """
+        ファイル1件分の処理を終える。既存の出力があってスキップした場合も呼ぶ。
+        """
+        if self.doc_pages < self.doc_page_count:
+            self.pages_done += self.doc_page_count - self.doc_pages
+        self.docs_done += 1
+        self.doc_name = ""
+        self.doc_page_count = 0
+        self.doc_pages = 0
+        self.doc_highlights = 0
+        if self.next_report <= time.monotonic():
+            self.report()
+
+    def snapshot(self, state: State = "running") -> dict:
+        now = time.monotonic()
+        elapsed = now - self.started
+        pages_per_sec = self.pages_done / elapsed if 0 < elapsed else 0.0
+        highlights_per_sec = self.highlights_done / elapsed if 0 < elapsed else 0.0
+
+        doc_elapsed = now - self.doc_started
+        doc_pages_per_sec = self.doc_pages / doc_elapsed if 0 < doc_elapsed else 0.0
+        doc_highlights_per_sec = (
+            self.doc_highlights / doc_elapsed if 0 < doc_elapsed else 0.0
+        )
+        doc_eta = None
+        doc_fraction = 0.0
+        if 0 < self.doc_page_count:
+            doc_fraction = self.doc_pages / self.doc_page_count
+            if 0 < self.doc_pages and state != "failed":
+                doc_eta = (
+                    doc_elapsed
+                    / self.doc_pages
+                    * (self.doc_page_count - self.doc_pages)
+                )
+
+        # ファイルごとのページ数は開くまでわからないので、処理済みのファイル数（途中のものは割合）から全体の残り時間を見積もる
+        overall_eta = None
+        fraction = 1.0
+        if 0 < self.total_docs:
+            fraction = (self.docs_done + doc_fraction) / self.total_docs
+        if state == "finished" or 1.0 <= fraction:
+            overall_eta = 0.0
+        elif state == "failed":
+            overall_eta = None
+        elif 0 < fraction:
+            overall_eta = elapsed / fraction * (1 - fraction)
+
+        return {
+            "state": state,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+            "elapsed_sec": round(elapsed, 1),
+            "documents_done": self.docs_done,
+            "documents_total": self.total_docs,
+            "pages_done": self.pages_done,
+            "highlights_done": self.highlights_done,
+            "pages_per_sec": round(pages_per_sec, 2),
+            "highlights_per_sec": round(highlights_per_sec, 2),
+            "eta_sec": None if overall_eta is None else round(overall_eta, 1),
+            "current": (
+                {
+                    "name": self.doc_name,
+                    "pages_done": self.doc_pages,
+                    "page_count": self.doc_page_count,
+                    "highlights_done": self.doc_highlights,
+                    "pages_per_sec": round(doc_pages_per_sec, 2),
+                    "highlights_per_sec": round(doc_highlights_per_sec, 2),
+                    "eta_sec": None if doc_eta is None else round(doc_eta, 1),
+                }
+                if self.doc_name
+                else None
+            ),
+        }
+
+    def report(self, state: State = "running") -> None:
+        self.next_report = time.monotonic() + self.interval
+        status = self.snapshot(state)
+
+        msg = (
+            f"{STATE_LABELS[state]} {status['documents_done']}/{status['documents_total']}件"
+            f" {status['pages_done']}ページ"
+            f"（{status['pages_per_sec']}ページ/秒、マーカー {status['highlights_per_sec']}件/秒）"
+            f" 残り約 {format_eta(status['eta_sec'])}"
+        )
+        current = status["current"]
+        if current:
+            msg += (
+                f"\n    処理中: {current['name']} {current['pages_done']}/{current['page_count']}ページ"
+                f"（{current['pages_per_sec']}ページ/秒、マーカー {current['highlights_per_sec']}件/秒）"
+                f" 残り約 {format_eta(current['eta_sec'])}"
+            )
+        smart_log("error" if state == "failed" else "info", msg)
+
+        if self.status_path is not None:
+            with atomic_open(self.status_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, indent=2, ensure_ascii=False)
@@ -1,11 +1,113 @@
+import codecs
 import sys
 import os
-import json
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
 
-from entry import JsonEntry
-from helpers import smart_log, stepped_outpath
+from entry import JsonEntry, load_json_entries
+from helpers import log_missing_href, smart_log, split_options, stepped_outpath
+from manifest import Manifest
+from pdfio import atomic_open
+
+TSV_HEADER = "FileVer:3"
+TSV_ENCODING = "utf-16"
+# 従来の `Path.write_text()` と同じく、改行はOS既定のもの（Windowsでは CRLF）にする
+TSV_NEWLINE = os.linesep
+
+
+class TsvSource(NamedTuple):
+    json_path: str
+    lines: list[str]
+    skipped: list[JsonEntry]
+
+
+def to_tsv_source(json_path: str) -> TsvSource:
+    """
+    1つのjsonファイルをTSVの行に変換する。一括モードではワーカープロセスで実行される。
+    """
+    lines: list[str] = []
+    skipped: list[JsonEntry] = []
+    genre = "4"
+    for ent in load_json_entries(json_path):
+        if ent.Href == "":
+            skipped.append(ent)
+            continue
+        lines.append("\t".join([genre, str(ent.AutoFlag), ent.Text, ent.Href]))
+    return TsvSource(json_path, lines, skipped)
+
+
+class TsvWriter:
+    """
+    `FileVer:3` 形式のTSVを少しずつUTF-16に変換しながら書き出す。
+    `max_bytes` を指定すると、そのサイズを超えないように `_001`, `_002`, ... と連番のファイルに分割する。
+    """
+
+    def __init__(self, out_path: Path, max_bytes: int | None = None) -> None:
+        self.out_path = out_path
+        self.max_bytes = max_bytes
+        self.paths: list[Path] = []
+        self._cm = None
+        self._file = None
+        self._encoder = None
+        self._size = 0
+        self._lines = 0
+
+    def _next_path(self) -> Path:
+        if self.max_bytes is None:
+            return self.out_path
+        idx = len(self.paths) + 1
+        return self.out_path.with_name(
+            f"{self.out_path.stem}_{idx:03d}{self.out_path.suffix}"
+        )
+
+    def _write(self, s: str) -> None:
+        data = self._encoder.encode(s)  # type: ignore
+        self._file.write(data)  # type: ignore
+        self._size += len(data)
+
+    def _open(self) -> None:
+        path = self._next_path()
+        self._cm = atomic_open(path, "wb")
+        self._file = self._cm.__enter__()
+        # ファイルごとにエンコーダーを作り直して、各ファイルの先頭にBOMを付ける
+        self._encoder = codecs.getincrementalencoder(TSV_ENCODING)()
+        self._size = 0
+        self._lines = 0
+        self.paths.append(path)
+        self._write(TSV_HEADER)
+
+    def _close(self, *exc_info) -> None:
+        if self._cm is None:
+            return
+        if exc_info[0] is None:
+            self._file.write(self._encoder.encode("", final=True))  # type: ignore
+        self._cm.__exit__(*exc_info)
+        self._cm = None
+
+    def write_line(self, line: str) -> None:
+        if self._cm is None:
+            self._open()
+        elif (
+            self.max_bytes is not None
+            and 0 < self._lines
+            and self.max_bytes
+            < self._size + len((TSV_NEWLINE + line).encode("utf-16-le"))
+        ):
+            self._close(None, None, None)
+            self._open()
+        self._write(TSV_NEWLINE + line)
+        self._lines += 1
+
+    def __enter__(self) -> "TsvWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._cm is None and exc_info[0] is None:
+            # 出力すべき行が1つもなくてもヘッダーだけのファイルは作っておく
+            self._open()
+        self._close(*exc_info)
 
 
 def json_to_tsv(json_path: str) -> None:
@@ -20,49 +122,86 @@ def json_to_tsv(json_path: str) -> None:
     smart_log("info", "処理開始", target_path=json_path)
 
     out_tsv_path = stepped_outpath(json_path, 3, ".txt", "_riri")
-    if out_tsv_path.exists():
-        # ここで生成するファイルは人間が処理する必要がないので上書き可とする
-        pass
-
-    entries: list[JsonEntry] = []
-    with open(json_path, "r", encoding="utf-8") as f:
-        content = json.load(f)
-        for item in content:
-            ent = JsonEntry(
-                Id=item["Id"],
-                PageIndex=item["PageIndex"],
-                Nombre=item["Nombre"],
-                Text=item["Text"],
-                Href=str(
-                    item["Href"]
-                ).strip(),  # 手入力で入るかもしれないスペースを除去
-                AutoFlag=item["AutoFlag"],
-                Locations=item["Locations"],
-            )
-            entries.append(ent)
+    manifest = Manifest.for_dir(out_tsv_path.parent)
+    build_args = (out_tsv_path.name, "rirify", [Path(json_path)], {}, [out_tsv_path])
+    # ここで生成するファイルは人間が処理する必要がないので上書き可とする
+    if not manifest.should_build(*build_args, protected=False):
+        return
 
-    tsv_lines: list[str] = ["FileVer:3"]
-    genre = "4"
-    for ent in entries:
-        if ent.Href == "":
+    source = to_tsv_source(json_path)
+    log_missing_href(source.json_path, source.skipped)
+
+    with TsvWriter(out_tsv_path) as writer:
+        for line in source.lines:
+            writer.write_line(line)
+    manifest.record(*build_args)
+
+
+def bulk_json_to_tsv(
+    json_paths: list[Path],
+    out_tsv_path: Path,
+    max_bytes: int | None = None,
+    workers: int | None = None,
+) -> None:
+    """
+    複数のjsonファイルを並列に読み込み、1つ（`max_bytes` を指定した場合は複数）のTSVにまとめて出力する。
+    出力される行の順番は `json_paths` の順番どおり。
+    """
+    targets: list[str] = []
+    for p in json_paths:
+        if p.name.endswith("_step3.json"):
+            targets.append(str(p))
+        else:
             smart_log(
                 "warning",
-                f"{ent.Id} ページインデックス {ent.PageIndex}（ノンブル {ent.Nombre}）: リンク先が指定されていません",
-                target_str=ent.Text,
+                "ファイル名が `*_step3.json` のパターンに一致しません",
+                target_path=p,
                 skip=True,
             )
-            continue
-        line = "\t".join([genre, str(ent.AutoFlag), ent.Text, ent.Href])
-        tsv_lines.append(line)
+    if len(targets) < 1:
+        smart_log("error", "処理対象のjsonファイルがありません")
+        return
+
+    manifest = Manifest.for_dir(out_tsv_path.parent)
+    key = out_tsv_path.name
+    inputs = [Path(t) for t in targets]
+    options = {"max_bytes": max_bytes}
+    previous_outputs = manifest.recorded_outputs(key) or [out_tsv_path]
+    if not manifest.should_build(
+        key, "rirify", inputs, options, previous_outputs, protected=False
+    ):
+        return
+
+    smart_log("info", f"{len(targets)}件のjsonファイルを一括処理します")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        with TsvWriter(out_tsv_path, max_bytes) as writer:
+            # `map()` は入力順に結果を返すので、読み込みが終わったものから順に書き出していける
+            for source in executor.map(to_tsv_source, targets):
+                log_missing_href(source.json_path, source.skipped)
+                for line in source.lines:
+                    writer.write_line(line)
 
-    out_tsv_path.write_text(encoding="utf-16", data="\n".join(tsv_lines))
+    # 分割数が減った場合に前回の余分なファイルが残らないようにする
+    written = {p.name for p in writer.paths}
+    for p in previous_outputs:
+        if p.name not in written:
+            p.unlink(missing_ok=True)
+    manifest.record(key, "rirify", inputs, options, writer.paths)
+
+    for p in writer.paths:
+        smart_log("info", "TSVファイルを出力しました", target_path=p)
 
 
 def main(args: list[str]) -> None:
+    args, options = split_options(args)
     if len(args) < 2:
         print(
             f"使用方法: `uv run .\\{os.path.basename(__file__)} target\\directory\\path`"
         )
+        print(
+            "フォルダ内のjsonファイルを1つのTSVにまとめる場合は `--bulk` （サイズで分割する場合は `--bulk=10` のようにMB単位で指定）を付ける"
+        )
         return
     d = Path(args[1])
     if not d.exists():
@@ -73,6 +212,23 @@ def main(args: list[str]) -> None:
             json_to_tsv(str(d))
         else:
             smart_log("error", "jsonファイルを指定してください")
+    elif "bulk" in options:
+        max_bytes = None
+        if options["bulk"]:
+            try:
+                max_bytes = int(float(options["bulk"]) * 1024 * 1024)
+            except (ValueError, OverflowError):
+                max_bytes = 0
+            if max_bytes < 1:
+                smart_log(
+                    "error",
+                    "`--bulk` の分割サイズは正の数（MB単位）で指定してください",
+                    target_str=options["bulk"],
+                )
+                return
+        bulk_json_to_tsv(
+            sorted(d.glob("*.json")), d / f"{d.resolve().name}_riri.txt", max_bytes
+        )
     else:
         for p in d.glob("*.json"):
             json_to_tsv(str(p))
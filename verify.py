@@ -0,0 +1,220 @@
+import os
+import sys
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import NamedTuple
+
+import pymupdf
+
+from entry import load_json_entries
+from helpers import chunk_size, limit_items, smart_log, stepped_outpath
+from linkify import from_jsonpath
+from pdfio import open_pdf
+
+# 保存時の丸めなどで座標がずれることがあるので、この差（pt）までは同じ矩形とみなす
+RECT_TOLERANCE = 1.0
+
+# これより少ないページ数なら、プロセスを立ち上げるより1プロセスで読んだほうが速い
+PARALLEL_MIN_PAGES = 300
+
+RectTuple = tuple[float, float, float, float]
+
+
+class PageLink(NamedTuple):
+    page_index: int
+    rect: RectTuple
+    uri: str
+
+
+class ExpectedLink(NamedTuple):
+    entry_id: str
+    page_index: int
+    rect: RectTuple
+    uri: str
+
+
+def links_in_pages(doc: pymupdf.Document, start: int, stop: int) -> list[PageLink]:
+    links: list[PageLink] = []
+    for i in range(start, stop):
+        page = doc[i]
+        for link in page.get_links():
+            if link["kind"] != pymupdf.LINK_URI:
+                continue
+            # `get_links()` の矩形は回転後の座標なので、jsonと同じ回転前の座標に戻す
+            rect = link["from"] * page.derotation_matrix
+            links.append(PageLink(i, tuple(rect), link.get("uri", "")))
+    return links
+
+
+def collect_links(pdf_path: str, start: int, stop: int) -> list[PageLink]:
+    # `checklist.render_crops()` と同じく、ワーカーごとにPDFを開き直す
+    doc = open_pdf(pdf_path)
+    links = links_in_pages(doc, start, stop)
+    doc.close()
+    return links
+
+
+def index_links(pdf_path: str, workers: int | None = None) -> dict[int, list[PageLink]]:
+    """
+    ページインデックスごとに `LINK_URI` のリンクをまとめる。
+    """
+    doc = open_pdf(pdf_path)
+    page_count = doc.page_count
+
+    if page_count < PARALLEL_MIN_PAGES:
+        links = links_in_pages(doc, 0, page_count)
+        doc.close()
+    else:
+        doc.close()
+        worker_count = workers or os.cpu_count() or 1
+        size = chunk_size(page_count, worker_count)
+        links = []
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            futures = [
+                executor.submit(
+                    collect_links, pdf_path, start, min(start + size, page_count)
+                )
+                for start in range(0, page_count, size)
+            ]
+            for future in futures:
+                links += future.result()
+
+    index: dict[int, list[PageLink]] = defaultdict(list)
+    for link in links:
+        index[link.page_index].append(link)
+    return index
+
+
+def is_same_rect(a: RectTuple, b: RectTuple) -> bool:
+    return all(abs(x - y) <= RECT_TOLERANCE for x, y in zip(a, b))
+
+
+def verify_links(json_path: str, workers: int | None = None) -> bool:
+    """
+    `_step3_linked.pdf` のリンクがjsonの内容と一致しているかを確認する。
+
+    `Text` か `Href` が空のエントリは `linkify.py` がリンクを挿入しないので、照合の対象外とする。
+
+    - missing: 対象のエントリの `Location` に対応するリンクがない
+    - duplicated: 1つの `Location` に対応するリンクが複数ある
+    - extra: どの `Location` にも対応しないリンクがある
+    """
+    if not json_path.endswith("_step3.json"):
+        smart_log(
+            "error",
+            "ファイル名が `*_step3.json` のパターンに一致しません",
+            target_path=json_path,
+        )
+        return False
+
+    linked_pdf_path = stepped_outpath(json_path, 3, ".pdf", "_linked")
+    if not linked_pdf_path.exists():
+        smart_log(
+            "error", "リンク挿入済みのPDFファイルがありません", target_path=linked_pdf_path
+        )
+        return False
+
+    smart_log("debug", "検証開始", target_path=linked_pdf_path)
+
+    expected: dict[int, list[ExpectedLink]] = defaultdict(list)
+    for ent in load_json_entries(json_path):
+        if ent.Text == "" or ent.Href == "":
+            continue
+        for loc in ent.Locations:
+            expected[loc.PageIndex].append(
+                ExpectedLink(ent.Id, loc.PageIndex, loc.Rect, ent.Href)
+            )
+
+    actual = index_links(str(linked_pdf_path), workers)
+
+    # 元のPDFに最初からあるリンク（出版社のリンクなど）は検証の対象外とする
+    pdf_path = from_jsonpath(json_path)
+    if pdf_path == "":
+        smart_log(
+            "warning",
+            "jsonファイル名から元のPDFファイルを特定できないため、元からあるリンクも検証対象に含めます",
+            target_path=json_path,
+        )
+    else:
+        for page_index, links in index_links(pdf_path, workers).items():
+            for link in links:
+                remaining = actual.get(page_index, [])
+                for i, l in enumerate(remaining):
+                    if l.uri == link.uri and is_same_rect(l.rect, link.rect):
+                        del remaining[i]
+                        break
+
+    missing: list[ExpectedLink] = []
+    duplicated: list[ExpectedLink] = []
+    extra: list[PageLink] = []
+
+    for page_index in sorted(set(expected) | set(actual)):
+        by_uri: dict[str, list[PageLink]] = defaultdict(list)
+        for link in actual.get(page_index, []):
+            by_uri[link.uri].append(link)
+        matched: set[PageLink] = set()
+
+        for exp in expected.get(page_index, []):
+            hits = [l for l in by_uri.get(exp.uri, []) if is_same_rect(l.rect, exp.rect)]
+            if len(hits) < 1:
+                missing.append(exp)
+            elif 1 < len(hits):
+                duplicated.append(exp)
+            matched.update(hits)
+
+        extra += [l for l in actual.get(page_index, []) if l not in matched]
+
+    if len(missing) + len(duplicated) + len(extra) < 1:
+        smart_log(
+            "info",
+            f"すべてのリンクが正しく挿入されています（{sum(len(v) for v in expected.values())}件）",
+            target_path=linked_pdf_path,
+        )
+        return True
+
+    details: list[str] = []
+    details += [
+        f"missing {e.entry_id} ページインデックス {e.page_index}: {e.uri}" for e in missing
+    ]
+    details += [
+        f"duplicated {e.entry_id} ページインデックス {e.page_index}: {e.uri}"
+        for e in duplicated
+    ]
+    details += [f"extra ページインデックス {l.page_index}: {l.uri}" for l in extra]
+    details = limit_items(details)
+
+    smart_log(
+        "error",
+        f"リンクの不一致があります（missing {len(missing)}件、duplicated {len(duplicated)}件、extra {len(extra)}件）"
+        + "".join(f"\n    - {d}" for d in details),
+        target_path=linked_pdf_path,
+    )
+    return False
+
+
+def main(args: list[str]) -> int:
+    if len(args) < 2:
+        print(
+            f"使用方法: `uv run .\\{os.path.basename(__file__)} target\\directory\\path`"
+        )
+        return 2
+    d = Path(args[1])
+    if not d.exists():
+        smart_log("error", "存在しないパスです", target_path=d)
+        return 2
+    if d.is_file():
+        if d.suffix == ".json":
+            return 0 if verify_links(str(d)) else 1
+        smart_log("error", "jsonファイルを指定してください")
+        return 2
+    ok = True
+    for p in d.glob("*_step3.json"):
+        ok = verify_links(str(p)) and ok
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    sys.exit(main(args))